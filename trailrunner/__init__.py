@@ -13,8 +13,11 @@ __author__ = "John Reese"
 from .__version__ import __version__
 from .core import (
     run,
+    run_iter,
     walk,
+    walk_parallel,
     walk_and_run,
+    inline,
     default_executor,
     thread_executor,
     TrailRunner,
@@ -2,18 +2,385 @@
 # Licensed under the MIT license
 
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Executor
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from itertools import chain, islice
 from pathlib import Path
-from typing import Iterable, Iterator, Callable, TypeVar, List, Dict
-
-from pathspec import PathSpec, RegexPattern
+from queue import Queue
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    Callable,
+    TypeVar,
+    List,
+    Dict,
+    Generic,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+from pathspec import PathSpec
 from pathspec.patterns.gitwildmatch import GitWildMatchPattern
+from pathspec.util import normalize_file
+
+try:  # pragma: no cover
+    import hyperscan
+
+    _HYPERSCAN_AVAILABLE = True
+except ImportError:
+    _HYPERSCAN_AVAILABLE = False
 
 T = TypeVar("T")
+F = TypeVar("F", bound=Callable[..., Any])
+V = TypeVar("V")
 
 
 INCLUDE_PATTERN = r".+\.pyi?$"
 ROOT_MARKERS = [Path("pyproject.toml"), Path(".git"), Path(".hg")]
+SERIAL_THRESHOLD = 1
+SPAWN_SERIAL_THRESHOLD = 4
+WALK_QUEUE_SIZE = 1024
+WALK_CHUNKSIZE = 8
+CACHE_SIZE = 1024
+
+_INCLUDE_SUFFIXES = (".py", ".pyi")
+_INCLUDE_RE = re.compile(INCLUDE_PATTERN)
+_NAMED_GROUP_RE = re.compile(r"\(\?P<\w+>")
+_WALK_DONE = object()
+
+
+class _MtimeCache(Generic[V]):
+    """
+    Thread-safe LRU cache of values loaded from paths, keyed by path.
+
+    Entries are invalidated whenever the path's modification time changes, including
+    when the path is created or deleted, so cached values always match what loading
+    the path would produce. Holds at most `maxsize` entries, or
+    :attr:`trailrunner.core.CACHE_SIZE` if not given.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[Path, Tuple[Optional[int], V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, path: Path, load: Callable[[Path], V]) -> V:
+        try:
+            mtime: Optional[int] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._data.move_to_end(path)
+                return entry[1]
+
+        # stat before loading, so a concurrent change invalidates on the next lookup
+        value = load(path)
+
+        with self._lock:
+            self._data[path] = (mtime, value)
+            self._data.move_to_end(path)
+            maxsize = CACHE_SIZE if self.maxsize is None else self.maxsize
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_GITIGNORE_CACHE: _MtimeCache[PathSpec] = _MtimeCache()
+_ROOT_CACHE: _MtimeCache[bool] = _MtimeCache()
+
+
+def clear_caches() -> None:
+    """
+    Clear all cached gitignore files, project root markers, and compiled patterns.
+    """
+    _GITIGNORE_CACHE.clear()
+    _ROOT_CACHE.clear()
+    _combine_regexes.cache_clear()
+    _compile_hyperscan.cache_clear()
+
+
+def _load_gitignore(gi_path: Path) -> PathSpec:
+    if gi_path.is_file():
+        lines = gi_path.read_text().splitlines()
+        return PathSpec.from_lines(GitWildMatchPattern, lines)
+
+    return PathSpec([])
+
+
+def _has_root_marker(path: Path) -> bool:
+    markers = {os.fspath(marker) for marker in ROOT_MARKERS}
+    try:
+        # one directory listing rather than a stat per marker
+        return not markers.isdisjoint(os.listdir(path))
+    except PermissionError:
+        # searchable but unreadable directories can't be listed
+        return any(os.path.exists(os.path.join(path, marker)) for marker in markers)
+    except OSError:
+        return False
+
+
+_Runs = Tuple[Tuple[Pattern[str], bool], ...]
+
+
+@lru_cache(maxsize=128)
+def _combine_regexes(regexes: Tuple[Tuple[str, bool], ...]) -> Optional[_Runs]:
+    runs: List[Tuple[List[str], bool]] = []
+    for regex, include in regexes:
+        # named groups can only appear once in a single expression
+        regex = _NAMED_GROUP_RE.sub("(?:", regex)
+        if runs and runs[-1][1] == include:
+            runs[-1][0].append(regex)
+        else:
+            runs.append(([regex], include))
+
+    try:
+        # last run first, so the first run to match decides
+        return tuple(
+            (re.compile("|".join(run)), include) for run, include in reversed(runs)
+        )
+    except re.error:
+        return None
+
+
+def _spec_regexes(spec: PathSpec) -> Optional[Tuple[Tuple[str, bool], ...]]:
+    regexes: List[Tuple[str, bool]] = []
+    for pattern in spec.patterns:
+        if pattern.include is None:
+            continue
+        regex = getattr(pattern, "regex", None)
+        if regex is None or regex.flags & ~re.UNICODE:
+            return None
+        regexes.append((regex.pattern, bool(pattern.include)))
+
+    return tuple(regexes)
+
+
+def _compile_combined(spec: PathSpec) -> Optional[_Runs]:
+    """
+    Fold runs of consecutive patterns of a `PathSpec` into compiled alternations.
+
+    Runs are returned last first, and the first run matching a path decides whether
+    it is ignored, preserving the "last matching pattern wins" semantics of gitignore.
+    Returns `None` if any pattern can't be expressed this way, in which case the
+    `PathSpec` should be used.
+    """
+    regexes = _spec_regexes(spec)
+    if regexes is None:
+        return None
+
+    return _combine_regexes(regexes)
+
+
+@lru_cache(maxsize=128)
+def _compile_hyperscan(
+    regexes: Tuple[Tuple[str, bool], ...]
+) -> Optional[Callable[[bytes], bool]]:  # pragma: no cover
+    """
+    Compile gitignore regexes into a single hyperscan database.
+
+    Each pattern gets its own id, in file order, and the highest matching id decides
+    whether a path is ignored, matching gitignore's "last matching pattern wins".
+    Returns `None` if hyperscan is unavailable or rejects any of the patterns.
+    """
+    if not _HYPERSCAN_AVAILABLE or not regexes:
+        return None
+
+    hs_flags = (
+        hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+    )
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    try:
+        db.compile(
+            expressions=[
+                _NAMED_GROUP_RE.sub("(?:", regex).encode("utf-8")
+                for regex, _ in regexes
+            ],
+            ids=list(range(len(regexes))),
+            elements=len(regexes),
+            flags=[hs_flags] * len(regexes),
+        )
+    except Exception:  # hyperscan's error types vary between versions
+        return None
+
+    includes = [include for _, include in regexes]
+    # a database has a single scratch space, so scans can't run concurrently
+    lock = threading.Lock()
+
+    def on_match(idx: int, start: int, end: int, flags: int, matched: Any) -> None:
+        matched.append(idx)
+
+    def match(data: bytes) -> bool:
+        matched: List[int] = []
+        with lock:
+            db.scan(data, match_event_handler=on_match, context=matched)
+        return bool(matched) and includes[max(matched)]
+
+    return match
+
+
+def _ignore_matcher(spec: PathSpec) -> Callable[[str], bool]:
+    regexes = _spec_regexes(spec)
+    runs = None if regexes is None else _combine_regexes(regexes)
+    if regexes is None or runs is None:
+        return spec.match_file
+
+    def search(path: str) -> bool:
+        for regex, include in runs:
+            if regex.search(path) is not None:
+                return include
+        return False
+
+    hs_match = _compile_hyperscan(regexes)
+    if hs_match is not None:  # pragma: no cover
+
+        def ignored(path: str) -> bool:
+            norm_path = normalize_file(path)
+            try:
+                return hs_match(norm_path.encode("utf-8"))
+            except UnicodeEncodeError:
+                # undecodable file names aren't valid utf-8, leave them to re
+                return search(norm_path)
+
+        return ignored
+
+    return lambda path: search(normalize_file(path))
+
+
+def _include_matcher(include: Optional[Pattern[str]] = None) -> Callable[[str], bool]:
+    if include is None:
+        if INCLUDE_PATTERN == _INCLUDE_RE.pattern:
+            # fast path: the default pattern only checks for python file extensions
+            return lambda path: path.endswith(_INCLUDE_SUFFIXES)
+        include = re.compile(INCLUDE_PATTERN)
+
+    search = include.search
+    return lambda path: search(normalize_file(path)) is not None
+
+
+def _scan_start(
+    path: Path, include: Callable[[str], bool], ignored: Callable[[str], bool]
+) -> Tuple[List[str], List[Path]]:
+    if path.is_dir():
+        if ignored(f"{path}/"):
+            return [], []
+        return [os.fspath(path)], []
+
+    if path.is_file() and include(str(path)) and not ignored(str(path)):
+        return [], [path]
+
+    return [], []
+
+
+def _scan_dir(
+    dirpath: str, include: Callable[[str], bool], ignored: Callable[[str], bool]
+) -> Tuple[List[str], List[Path]]:
+    """
+    Scan a single directory, returning unignored subdirectories and significant files.
+    """
+    dirs: List[str] = []
+    files: List[Path] = []
+
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+
+            if entry.is_dir():
+                # prune ignored directories instead of filtering their contents;
+                # the trailing slash is needed to match directory-only patterns
+                if not ignored(entry.path + "/"):
+                    dirs.append(entry.path)
+
+            # DirEntry reuses any stat done by is_dir() for is_file(), so the only
+            # savings left are checking the cheaper include pattern first
+            elif include(entry.path) and entry.is_file() and not ignored(entry.path):
+                files.append(Path(entry.path))
+
+    return dirs, files
+
+
+def _run_chunk(func: Callable[[Path], T], paths: Sequence[Union[str, Path]]) -> List[T]:
+    return [func(Path(path)) for path in paths]
+
+
+def _submit_chunk(
+    exe: Executor, func: Callable[[Path], T], chunk: List[Path]
+) -> "Future[List[T]]":
+    if isinstance(exe, ProcessPoolExecutor):
+        # strings are much cheaper to pickle than Path objects
+        return exe.submit(_run_chunk, func, [os.fspath(path) for path in chunk])
+    return exe.submit(_run_chunk, func, chunk)
+
+
+def inline(func: F) -> F:
+    """
+    Mark a function as cheap enough to run without a process pool.
+
+    When :func:`run` or :func:`walk_and_run` are given a marked function, or a
+    `functools.partial` of one, it is run on a thread pool in the current process
+    instead of the runner's executor. This avoids the cost of pickling the function
+    and paths, and allows running functions that can't be pickled at all::
+
+        @trailrunner.inline
+        def line_count(path: Path) -> int:
+            return len(path.read_text().splitlines())
+
+    """
+    setattr(func, "_trailrunner_inline", True)
+    return func
+
+
+def _is_inline(func: Callable[..., Any]) -> bool:
+    while True:
+        if getattr(func, "_trailrunner_inline", False):
+            return True
+        if not isinstance(func, partial):
+            return False
+        func = func.func
+
+
+def default_serial_threshold() -> int:
+    """
+    Largest number of paths that :meth:`TrailRunner.run` will run serially.
+
+    Starting a process pool costs more than running a function on a handful of paths.
+    On macOS, where the "spawn" start method must re-import everything in every child
+    process, this uses the larger :attr:`trailrunner.core.SPAWN_SERIAL_THRESHOLD`.
+    """
+    import trailrunner
+
+    if sys.platform == "darwin" and trailrunner.context.get_start_method() == "spawn":
+        return max(SERIAL_THRESHOLD, SPAWN_SERIAL_THRESHOLD)
+
+    return SERIAL_THRESHOLD
 
 
 def default_executor() -> ProcessPoolExecutor:
@@ -36,27 +403,94 @@ def thread_executor() -> ThreadPoolExecutor:
 
 
 class TrailRunner:
+    """
+    Walk paths and run functions on them, using the given executor factory.
+
+    If `include_pattern` is given, it is used by :meth:`walk` in place of
+    :attr:`trailrunner.core.INCLUDE_PATTERN`, and is only compiled once.
+
+    By default, a new executor is created, and shut down, for every call to
+    :meth:`run`. When used as a context manager, the first executor created is kept
+    alive and reused until the context exits, or :meth:`close` is called::
+
+        with trailrunner.core.DEFAULT_RUNNER:
+            for paths in batches:
+                trailrunner.run(paths, func)
+
+    """
+
     def __init__(
-        self, executor_factory: Callable[[], Executor] = default_executor
+        self,
+        executor_factory: Callable[[], Executor] = default_executor,
+        serial_threshold: Optional[int] = None,
+        include_pattern: Optional[str] = None,
     ) -> None:
         self.executor_factory = executor_factory
+        self.serial_threshold = serial_threshold
+        self._include_re = re.compile(include_pattern) if include_pattern else None
+        self._executor: Optional[Executor] = None
+        self._reuse_executor = False
+
+    def __enter__(self) -> "TrailRunner":
+        self._reuse_executor = True
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut down any long-lived executor, and stop reusing executors.
+        """
+        self._reuse_executor = False
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _serial_threshold(self) -> int:
+        if self.serial_threshold is None:
+            return default_serial_threshold()
+        return self.serial_threshold
+
+    @contextmanager
+    def _executor_context(self, func: Callable[..., Any]) -> Iterator[Executor]:
+        if _is_inline(func):
+            with thread_executor() as exe:
+                yield exe
+            return
+
+        if not self._reuse_executor:
+            with self.executor_factory() as exe:
+                yield exe
+            return
+
+        if self._executor is None:
+            self._executor = self.executor_factory()
+        yield self._executor
 
     @staticmethod
-    def project_root(path: Path) -> Path:
+    def project_root(path: Path, resolve_symlinks: bool = True) -> Path:
         """
         Find the project root, looking upward from the given path.
 
         Looks through all parent paths until either the root is reached, or a directory
         is found that contains any of :attr:`trailrunner.core.ROOT_MARKERS`.
+
+        If `resolve_symlinks` is false, the path is only made absolute, and parents are
+        found lexically, skipping the syscalls needed to resolve symlinks.
+
+        Whether each directory contains a marker is cached, and rechecked whenever the
+        directory's modification time changes.
         """
-        real_path = path.resolve()
+        abs_path = os.path.abspath(path)
+        real_path = Path(os.path.realpath(abs_path) if resolve_symlinks else abs_path)
 
         parents = list(real_path.parents)
         if real_path.is_dir():
             parents.insert(0, real_path)
 
         for parent in parents:
-            if any((parent / marker).exists() for marker in ROOT_MARKERS):
+            if _ROOT_CACHE.get(parent, _has_root_marker):
                 return parent
 
         return parent
@@ -68,47 +502,77 @@ class TrailRunner:
 
         If none is found, an empty PathSpec is returned. If the path is not a directory,
         `ValueError` is raised.
+
+        Parsed files are cached, and only re-parsed when their modification time
+        changes, or when they are created or deleted.
         """
         if not path.is_dir():
             raise ValueError(f"path {path} not a directory")
 
-        gi_path = path / ".gitignore"
-
-        if gi_path.is_file():
-            lines = gi_path.read_text().splitlines()
-            return PathSpec.from_lines(GitWildMatchPattern, lines)
+        return _GITIGNORE_CACHE.get(path / ".gitignore", _load_gitignore)
 
-        return PathSpec([])
+    def _matchers(
+        self, path: Path
+    ) -> Tuple[Callable[[str], bool], Callable[[str], bool]]:
+        root = self.project_root(path, resolve_symlinks=False)
+        return _include_matcher(self._include_re), _ignore_matcher(self.gitignore(root))
 
     def walk(self, path: Path) -> Iterator[Path]:
         """
         Generate all significant file paths, starting from the given path.
 
         Finds the project root and any associated gitignore. Filters any paths that match
-        a gitignore pattern. Recurses into subdirectories, and otherwise only includes
-        files that match the :attr:`trailrunner.core.INCLUDE_PATTERN` regex.
+        a gitignore pattern, without descending into ignored directories. Recurses into
+        subdirectories, and otherwise only includes files that match the
+        :attr:`trailrunner.core.INCLUDE_PATTERN` regex.
 
         Returns a generator that yields each significant file as the tree is walked.
         """
-        root = self.project_root(path)
-        ignore = self.gitignore(root)
-        include = PathSpec([RegexPattern(INCLUDE_PATTERN)])
+        include, ignored = self._matchers(path)
 
-        def gen(children: Iterable[Path]) -> Iterator[Path]:
-            for child in children:
+        stack, files = _scan_start(path, include, ignored)
+        yield from files
 
-                if ignore.match_file(child):
-                    continue
+        while stack:
+            dirs, files = _scan_dir(stack.pop(), include, ignored)
+            stack.extend(dirs)
+            yield from files
 
-                if child.is_file() and include.match_file(child):
-                    yield child
-
-                elif child.is_dir():
-                    yield from gen(child.iterdir())
+    def walk_parallel(
+        self, path: Path, max_workers: Optional[int] = None
+    ) -> List[Path]:
+        """
+        Gather all significant file paths, scanning directories on a thread pool.
 
-        return gen([path])
+        Finds the same paths as :func:`walk`, but scans multiple directories at once,
+        overlapping the filesystem latency of each. This is most useful on network or
+        other high latency filesystems.
 
-    def run(self, paths: Iterable[Path], func: Callable[[Path], T]) -> Dict[Path, T]:
+        Returns a sorted list of paths once the entire tree has been walked.
+        """
+        include, ignored = self._matchers(path)
+
+        dirs, results = _scan_start(path, include, ignored)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as exe:
+            pending = {exe.submit(_scan_dir, d, include, ignored) for d in dirs}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirs, files = future.result()
+                    results.extend(files)
+                    pending.update(
+                        exe.submit(_scan_dir, d, include, ignored) for d in dirs
+                    )
+
+        return sorted(results)
+
+    def run(
+        self,
+        paths: Iterable[Path],
+        func: Callable[[Path], T],
+        chunksize: Optional[int] = None,
+    ) -> Dict[Path, T]:
         """
         Run a given function once for each path, using a process pool for concurrency.
 
@@ -119,36 +583,162 @@ class TrailRunner:
 
         Uses a process pool with "spawned" processes that share no state with the parent
         process, to enforce consistent behavior on Linux, macOS, and Windows, where forked
-        processes are not possible.
+        processes are not possible. This requires that `func` can be pickled, so it
+        should be a module-level function, or a `functools.partial` of one, and should
+        be cheap to pickle, as it is sent along with every chunk of paths.
+
+        Paths are sent to the executor in chunks of `chunksize` paths, to reduce the
+        overhead of communicating with child processes. By default, paths are split
+        into roughly four chunks per CPU core.
+
+        If there are no more paths than the runner's `serial_threshold` (see
+        :func:`default_serial_threshold`), `func` is called serially in the current
+        process instead, avoiding the cost of starting an executor.
         """
         paths = list(paths)
+        results = dict(self.run_iter(paths, func, chunksize))
+        return {path: results[path] for path in paths}
+
+    def run_iter(
+        self,
+        paths: Iterable[Path],
+        func: Callable[[Path], T],
+        chunksize: Optional[int] = None,
+    ) -> Iterator[Tuple[Path, T]]:
+        """
+        Run a given function once for each path, generating results as they complete.
 
-        with self.executor_factory() as exe:
-            results = list(exe.map(func, paths))
+        Works like :func:`run`, but yields a `(path, result)` tuple for each path as
+        soon as its chunk of work has finished, in order of completion. If any call
+        to `func` raises an exception, or the generator is closed early, any work not
+        yet started is cancelled.
+        """
+        paths = list(paths)
 
-        return dict(zip(paths, results))
+        if len(paths) <= self._serial_threshold():
+            for path in paths:
+                yield path, func(path)
+            return
+
+        if chunksize is None:
+            chunksize = max(1, len(paths) // ((os.cpu_count() or 1) * 4))
+
+        with self._executor_context(func) as exe:
+            futures: Dict[Future[List[T]], List[Path]] = {}
+            for idx in range(0, len(paths), chunksize):
+                chunk = paths[idx : idx + chunksize]
+                futures[_submit_chunk(exe, func, chunk)] = chunk
+
+            try:
+                for future in as_completed(futures):
+                    # drop finished chunks so only in-flight results are kept alive
+                    chunk = futures.pop(future)
+                    yield from zip(chunk, future.result())
+            finally:
+                for future in futures:
+                    future.cancel()
 
     def walk_and_run(
-        self, paths: Iterable[Path], func: Callable[[Path], T]
+        self,
+        paths: Iterable[Path],
+        func: Callable[[Path], T],
+        concurrency: Optional[int] = None,
+        chunksize: Optional[int] = None,
     ) -> Dict[Path, T]:
         """
         Walks each path given, and runs the given function on all gathered paths.
 
         See :func:`walk` for details on how paths are gathered, and :func:`run` for how
         functions are run for each gathered path.
-        """
-        all_paths: List[Path] = []
-        for path in paths:
-            all_paths.extend(self.walk(path))
 
-        return self.run(all_paths, func)
+        If `concurrency` is given, each path is walked with :func:`walk_parallel` using
+        that many threads.
+
+        Walking happens on a background thread, and paths are submitted to the
+        executor as soon as they are found, so that `func` runs while the rest of the
+        tree is still being walked. Paths are submitted in chunks of up to `chunksize`
+        paths, defaulting to :attr:`trailrunner.core.WALK_CHUNKSIZE`, but a partial
+        chunk is submitted whenever the walk falls behind.
+        """
+        walked: Queue[object] = Queue(maxsize=WALK_QUEUE_SIZE)
+        stop = threading.Event()
+        errors: List[Exception] = []
+
+        def produce() -> None:
+            try:
+                for root in paths:
+                    if concurrency:
+                        gen: Iterable[Path] = self.walk_parallel(root, concurrency)
+                    else:
+                        gen = self.walk(root)
+                    for path in gen:
+                        if stop.is_set():
+                            return
+                        walked.put(path)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                walked.put(_WALK_DONE)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        found = cast(Iterator[Path], iter(walked.get, _WALK_DONE))
+        try:
+            threshold = self._serial_threshold()
+            head = list(islice(found, threshold + 1))
+
+            if len(head) <= threshold:
+                producer.join()
+                if errors:
+                    raise errors[0]
+                return {path: func(path) for path in head}
+
+            if chunksize is None:
+                chunksize = WALK_CHUNKSIZE
+
+            with self._executor_context(func) as exe:
+                futures: Dict[Future[List[T]], List[Path]] = {}
+                try:
+                    order: List[Path] = []
+                    chunk: List[Path] = []
+                    for path in chain(head, found):
+                        order.append(path)
+                        chunk.append(path)
+                        # don't hold back a partial chunk while waiting on the walk
+                        if len(chunk) >= chunksize or walked.empty():
+                            futures[_submit_chunk(exe, func, chunk)] = chunk
+                            chunk = []
+
+                    if chunk:
+                        futures[_submit_chunk(exe, func, chunk)] = chunk
+
+                    producer.join()
+                    if errors:
+                        raise errors[0]
+
+                    results: Dict[Path, T] = {}
+                    for future in as_completed(futures):
+                        chunk = futures.pop(future)
+                        results.update(zip(chunk, future.result()))
+                    return {path: results[path] for path in order}
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        finally:
+            # unblock and wait for the walker if we're bailing out early
+            stop.set()
+            for _ in found:
+                pass
+            producer.join()
 
 
 DEFAULT_RUNNER: TrailRunner = TrailRunner()
 
 
-def project_root(path: Path) -> Path:
-    return DEFAULT_RUNNER.project_root(path)
+def project_root(path: Path, resolve_symlinks: bool = True) -> Path:
+    return DEFAULT_RUNNER.project_root(path, resolve_symlinks)
 
 
 def gitignore(path: Path) -> PathSpec:
@@ -159,9 +749,30 @@ def walk(path: Path) -> Iterator[Path]:
     return DEFAULT_RUNNER.walk(path)
 
 
-def run(paths: Iterable[Path], func: Callable[[Path], T]) -> Dict[Path, T]:
-    return DEFAULT_RUNNER.run(paths, func)
+def run(
+    paths: Iterable[Path],
+    func: Callable[[Path], T],
+    chunksize: Optional[int] = None,
+) -> Dict[Path, T]:
+    return DEFAULT_RUNNER.run(paths, func, chunksize)
+
+
+def run_iter(
+    paths: Iterable[Path],
+    func: Callable[[Path], T],
+    chunksize: Optional[int] = None,
+) -> Iterator[Tuple[Path, T]]:
+    return DEFAULT_RUNNER.run_iter(paths, func, chunksize)
+
+
+def walk_parallel(path: Path, max_workers: Optional[int] = None) -> List[Path]:
+    return DEFAULT_RUNNER.walk_parallel(path, max_workers)
 
 
-def walk_and_run(paths: Iterable[Path], func: Callable[[Path], T]) -> Dict[Path, T]:
-    return DEFAULT_RUNNER.walk_and_run(paths, func)
+def walk_and_run(
+    paths: Iterable[Path],
+    func: Callable[[Path], T],
+    concurrency: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> Dict[Path, T]:
+    return DEFAULT_RUNNER.walk_and_run(paths, func, concurrency, chunksize)
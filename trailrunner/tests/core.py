@@ -3,14 +3,16 @@
 
 import multiprocessing
 import os
+import weakref
 from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Iterator
-from unittest import TestCase
-from unittest.mock import Mock
+from typing import Iterator, List
+from unittest import TestCase, skipUnless
+from unittest.mock import Mock, call, patch
 
-from pathspec import PathSpec
+from pathspec import PathSpec, RegexPattern
 from pathspec.patterns.gitwildmatch import GitWildMatchPattern
 
 import trailrunner
@@ -37,6 +39,7 @@ class CoreTest(TestCase):
 
     def tearDown(self) -> None:
         self.temp_dir.cleanup()
+        core.clear_caches()
 
     def test_set_context(self) -> None:
         orig_context = trailrunner.context
@@ -115,6 +118,20 @@ class CoreTest(TestCase):
                 result = self.trailrunner.project_root(Path("berry.py"))
                 self.assertEqual(self.td, result)
 
+        with self.subTest("missing parent"):
+            self.assertFalse(core._has_root_marker(self.td / "missing"))
+            result = self.trailrunner.project_root(self.td / "missing" / "foo.py")
+            self.assertEqual(self.td, result)
+
+        with self.subTest("unlistable parent"):
+            core.clear_caches()
+            with patch("os.listdir", side_effect=PermissionError("denied")) as listdir:
+                self.assertTrue(core._has_root_marker(self.td))
+                self.assertFalse(core._has_root_marker(self.td / "frob"))
+                result = self.trailrunner.project_root(self.td / "frob" / "berry.py")
+                self.assertEqual(self.td, result)
+                listdir.assert_called()
+
     def test_project_root_multilevel(self) -> None:
         (self.td / ".hg").mkdir()
         inner = self.td / "foo" / "bar"
@@ -139,6 +156,80 @@ class CoreTest(TestCase):
             result = self.trailrunner.project_root(inner / "fuzz" / "ball.py")
             self.assertEqual(inner, result)
 
+    def test_project_root_symlink(self) -> None:
+        project = self.td / "project"
+        (project / ".git").mkdir(parents=True)
+        (project / "inner").mkdir()
+        (self.td / "link").symlink_to(project / "inner", target_is_directory=True)
+        (self.td / "pyproject.toml").write_text("\n")
+
+        with self.subTest("resolved"):
+            result = self.trailrunner.project_root(self.td / "link")
+            self.assertEqual(project, result)
+
+        with self.subTest("lexical"):
+            result = self.trailrunner.project_root(
+                self.td / "link", resolve_symlinks=False
+            )
+            self.assertEqual(self.td, result)
+
+        with self.subTest("retargeted"):
+            other = self.td / "other"
+            (other / ".hg").mkdir(parents=True)
+            (self.td / "link").unlink()
+            (self.td / "link").symlink_to(other, target_is_directory=True)
+            result = self.trailrunner.project_root(self.td / "link")
+            self.assertEqual(other, result)
+
+    def test_caches(self) -> None:
+        def touch(path: Path) -> None:
+            # ensure a new mtime, even on filesystems with coarse timestamps
+            mtime = path.stat().st_mtime_ns + 1_000_000_000
+            os.utime(path, ns=(mtime, mtime))
+
+        inner = self.td / "foo" / "bar"
+        inner.mkdir(parents=True)
+        (self.td / ".git").mkdir()
+
+        with self.subTest("root marker added"):
+            self.assertEqual(self.td, self.trailrunner.project_root(inner))
+            (self.td / "foo" / "pyproject.toml").write_text("\n")
+            touch(self.td / "foo")
+            self.assertEqual(self.td / "foo", self.trailrunner.project_root(inner))
+
+        with self.subTest("root marker removed"):
+            (self.td / "foo" / "pyproject.toml").unlink()
+            touch(self.td / "foo")
+            self.assertEqual(self.td, self.trailrunner.project_root(inner))
+
+        with self.subTest("gitignore created"):
+            self.assertFalse(self.trailrunner.gitignore(self.td).patterns)
+            (self.td / ".gitignore").write_text("*.c\n")
+            self.assertTrue(self.trailrunner.gitignore(self.td).patterns)
+
+        with self.subTest("gitignore deleted"):
+            (self.td / ".gitignore").unlink()
+            self.assertFalse(self.trailrunner.gitignore(self.td).patterns)
+
+        with self.subTest("bounded size"):
+            cache: core._MtimeCache[str] = core._MtimeCache()
+            with patch.object(core, "CACHE_SIZE", 2):
+                for path in (self.td, inner, self.td / "foo"):
+                    self.assertEqual(str(path), cache.get(path, str))
+                self.assertEqual(2, len(cache))
+
+            load = Mock(side_effect=str)
+            cache.get(inner, load)
+            cache.get(self.td, load)
+            self.assertEqual([call(self.td)], load.call_args_list)
+
+        with self.subTest("clear caches"):
+            core.clear_caches()
+            self.assertEqual(0, len(core._GITIGNORE_CACHE))
+            self.assertEqual(0, len(core._ROOT_CACHE))
+            self.assertEqual(0, core._combine_regexes.cache_info().currsize)
+            self.assertEqual(0, core._compile_hyperscan.cache_info().currsize)
+
     def test_gitignore(self) -> None:
         with self.subTest("no .gitignore"):
             result = self.trailrunner.gitignore(self.td)
@@ -160,6 +251,82 @@ class CoreTest(TestCase):
             for pattern in result.patterns:
                 self.assertIsInstance(pattern, GitWildMatchPattern)
 
+        with self.subTest("cached file"):
+            first = self.trailrunner.gitignore(self.td)
+            second = self.trailrunner.gitignore(self.td)
+            self.assertIs(first, second)
+
+        with self.subTest("modified file"):
+            gi_path = self.td / ".gitignore"
+            gi_path.write_text("*.py\n")
+            mtime = gi_path.stat().st_mtime_ns + 1_000_000_000
+            os.utime(gi_path, ns=(mtime, mtime))
+            result = self.trailrunner.gitignore(self.td)
+            self.assertIsNot(first, result)
+            self.assertTrue(result.match_file("foo.py"))
+
+    def test_ignore_matcher(self) -> None:
+        lines = ["*.py", "!foo.py", "vendor/", "!vendor/keep.py", "/build", "# no"]
+        spec = PathSpec.from_lines(GitWildMatchPattern, lines)
+        paths = [
+            "a.py",
+            "foo.py",
+            "bar/foo.py",
+            "vendor/x.txt",
+            "vendor/keep.py",
+            "build/x.txt",
+            "src/build/x.txt",
+            "/abs/vendor/x.txt",
+            "./foo.py",
+            "README",
+        ]
+
+        with self.subTest("combined"):
+            self.assertIsNotNone(core._compile_combined(spec))
+            ignored = core._ignore_matcher(spec)
+            for path in paths:
+                self.assertEqual(spec.match_file(path), ignored(path), path)
+
+        with self.subTest("unanchored"):
+            for lines in (["*", "!*/", "!*.py"], ["vendor/", "!*/"]):
+                spec = PathSpec.from_lines(GitWildMatchPattern, lines)
+                ignored = core._ignore_matcher(spec)
+                for path in paths + ["pkg/b.py", "pkg/", "vendor/", "vendor/x.py"]:
+                    self.assertEqual(spec.match_file(path), ignored(path), path)
+
+        with self.subTest("many negations"):
+            lines = ["*.pyc"] + [f"!keep{i}.pyc" for i in range(600)] + ["keep5.pyc"]
+            spec = PathSpec.from_lines(GitWildMatchPattern, lines)
+            ignored = core._ignore_matcher(spec)
+            self.assertNotEqual(spec.match_file, ignored)
+            for path in ("a.pyc", "keep1.pyc", "sub/keep599.pyc", "keep5.pyc", "a.py"):
+                self.assertEqual(spec.match_file(path), ignored(path), path)
+
+        with self.subTest("invalid"):
+            self.assertIsNone(core._combine_regexes((("^(", True),)))
+
+        with self.subTest("empty"):
+            ignored = core._ignore_matcher(PathSpec([]))
+            for path in paths:
+                self.assertFalse(ignored(path), path)
+
+        with self.subTest("fallback"):
+            spec = PathSpec([RegexPattern(r"(?i)\.PY$")])
+            self.assertIsNone(core._compile_combined(spec))
+            self.assertEqual(spec.match_file, core._ignore_matcher(spec))
+
+    @skipUnless(core._HYPERSCAN_AVAILABLE, "hyperscan not installed")
+    def test_ignore_matcher_hyperscan(self) -> None:
+        lines = ["*.py", "!foo.py", "vendor/", "!vendor/keep.py", "/build", "# no"]
+        spec = PathSpec.from_lines(GitWildMatchPattern, lines)
+        regexes = core._spec_regexes(spec)
+        assert regexes is not None
+        self.assertIsNotNone(core._compile_hyperscan(regexes))
+
+        ignored = core._ignore_matcher(spec)
+        for path in ("a.py", "foo.py", "vendor/x.txt", "vendor/keep.py", "README"):
+            self.assertEqual(spec.match_file(path), ignored(path), path)
+
     def test_walk(self) -> None:
         (self.td / ".git").mkdir()
         inner = self.td / "inner" / "subproject"
@@ -265,6 +432,94 @@ class CoreTest(TestCase):
                 ]
                 self.assertListEqual(expected, result)
 
+        (self.td / ".gitignore").write_text("vendor/\n!vendor/useful/old.py\n")
+
+        with self.subTest("ignored directory not descended"):
+            result = sorted(self.trailrunner.walk(self.td))
+            expected = [
+                self.td / "foo" / "a.py",
+                self.td / "foo" / "bar" / "b.py",
+                self.td / "foo" / "bar" / "c.pyi",
+                self.td / "inner" / "subproject" / "fuzz" / "ball.py",
+            ]
+            self.assertListEqual(expected, result)
+
+        with self.subTest("excluded starting file"):
+            result = sorted(self.trailrunner.walk(self.td / "foo" / "d.cpp"))
+            self.assertListEqual([], result)
+
+        with self.subTest("ignored starting directory"):
+            result = sorted(self.trailrunner.walk(self.td / "vendor" / "useful"))
+            self.assertListEqual([], result)
+
+        with self.subTest("custom include pattern"):
+            with patch.object(core, "INCLUDE_PATTERN", r".+/[ad]\..+$"):
+                result = sorted(self.trailrunner.walk(self.td / "foo"))
+                expected = [
+                    self.td / "foo" / "a.py",
+                    self.td / "foo" / "d.cpp",
+                ]
+                self.assertListEqual(expected, result)
+
+        with self.subTest("unanchored include pattern"):
+            with patch.object(core, "INCLUDE_PATTERN", r"\.cpp$"):
+                result = sorted(self.trailrunner.walk(self.td / "foo"))
+                self.assertListEqual([self.td / "foo" / "d.cpp"], result)
+
+        with self.subTest("runner include pattern"):
+            for pattern in (r".+\.cpp$", r"\.cpp$"):
+                runner = trailrunner.TrailRunner(include_pattern=pattern)
+                result = sorted(runner.walk(self.td / "foo"))
+                self.assertListEqual([self.td / "foo" / "d.cpp"], result)
+
+    def test_walk_parallel(self) -> None:
+        (self.td / ".git").mkdir()
+        (self.td / ".gitignore").write_text("vendor/\n")
+        for name in ("foo", "bar", "baz"):
+            (self.td / name / "inner").mkdir(parents=True)
+            (self.td / name / "a.py").write_text("\n")
+            (self.td / name / "inner" / "b.pyi").write_text("\n")
+            (self.td / name / "inner" / "c.txt").write_text("\n")
+            (self.td / "vendor" / name).mkdir(parents=True)
+            (self.td / "vendor" / name / "d.py").write_text("\n")
+
+        with self.subTest("absolute root"):
+            expected = sorted(self.trailrunner.walk(self.td))
+            result = self.trailrunner.walk_parallel(self.td, max_workers=4)
+            self.assertEqual(6, len(result))
+            self.assertListEqual(expected, result)
+
+        with self.subTest("local subdir"):
+            with cd(self.td):
+                expected = sorted(self.trailrunner.walk(Path("foo")))
+                result = self.trailrunner.walk_parallel(Path("foo"))
+                self.assertListEqual(expected, result)
+
+        with self.subTest("single file"):
+            result = self.trailrunner.walk_parallel(self.td / "foo" / "a.py")
+            self.assertListEqual([self.td / "foo" / "a.py"], result)
+
+    def test_module_functions(self) -> None:
+        (self.td / ".git").mkdir()
+        (self.td / ".gitignore").write_text("*.pyi\n")
+        (self.td / "foo.py").write_text("\n")
+        (self.td / "bar.pyi").write_text("\n")
+        expected = [self.td / "foo.py"]
+
+        with patch.object(core, "DEFAULT_RUNNER", self.trailrunner):
+            with self.subTest("gitignore"):
+                self.assertTrue(core.gitignore(self.td).match_file("bar.pyi"))
+
+            with self.subTest("walk"):
+                self.assertListEqual(expected, list(core.walk(self.td)))
+
+            with self.subTest("walk_parallel"):
+                self.assertListEqual(expected, core.walk_parallel(self.td, 2))
+
+            with self.subTest("walk_and_run"):
+                results = core.walk_and_run([self.td], str, concurrency=2)
+                self.assertDictEqual({expected[0]: str(expected[0])}, results)
+
     def test_run(self) -> None:
         def get_posix(path: Path) -> str:
             return path.as_posix()
@@ -278,6 +533,155 @@ class CoreTest(TestCase):
         result = self.trailrunner.run(paths, get_posix)
         self.assertDictEqual(expected, result)
 
+        with self.subTest("chunksize"):
+            executor = core.thread_executor()
+            with patch.object(executor, "submit", wraps=executor.submit) as submit:
+                runner = trailrunner.TrailRunner(lambda: executor)
+                result = runner.run(paths, get_posix, chunksize=2)
+                self.assertDictEqual(expected, result)
+                submit.assert_any_call(core._run_chunk, get_posix, paths[:2])
+                submit.assert_any_call(core._run_chunk, get_posix, paths[2:])
+                self.assertEqual(2, submit.call_count)
+
+        with self.subTest("process pool"):
+            runner = trailrunner.TrailRunner(core.default_executor)
+            result = runner.run(paths, os.fspath)
+            self.assertDictEqual({p: str(p) for p in paths}, result)
+
+        with self.subTest("input order"):
+            with patch.object(core, "as_completed", lambda fs: list(fs)[::-1]):
+                result = self.trailrunner.run(paths, get_posix, chunksize=1)
+            self.assertListEqual(paths, list(result))
+
+    def test_run_iter(self) -> None:
+        def get_posix(path: Path) -> str:
+            return path.as_posix()
+
+        def fail(path: Path) -> str:
+            if path.name == "bar.py":
+                raise ValueError("no bar")
+            return path.as_posix()
+
+        paths = [Path("foo.py"), Path("bar.py"), Path("baz.py")]
+
+        with self.subTest("results"):
+            result = self.trailrunner.run_iter(paths, get_posix, chunksize=1)
+            self.assertIsInstance(result, Iterator)
+            self.assertCountEqual([(p, p.as_posix()) for p in paths], list(result))
+
+        with self.subTest("exception"):
+            with self.assertRaisesRegex(ValueError, "no bar"):
+                list(self.trailrunner.run_iter(paths, fail, chunksize=1))
+
+        with self.subTest("releases results"):
+
+            class Box:
+                pass
+
+            refs: List["weakref.ref[Box]"] = []
+            for _, box in self.trailrunner.run_iter(paths, lambda p: Box(), 1):
+                refs.append(weakref.ref(box))
+                del box
+                self.assertEqual([None] * (len(refs) - 1), [r() for r in refs[:-1]])
+
+        with self.subTest("module function"):
+            with patch.object(core, "DEFAULT_RUNNER", self.trailrunner):
+                result = core.run_iter(paths, get_posix)
+                self.assertCountEqual([(p, p.as_posix()) for p in paths], list(result))
+
+    def test_inline(self) -> None:
+        @trailrunner.inline
+        def get_posix(path: Path) -> str:
+            return path.as_posix()
+
+        def get_name(path: Path, suffix: str) -> str:
+            return path.name + suffix
+
+        paths = [Path("foo.py"), Path("bar.py"), Path("baz.py")]
+        factory = Mock(side_effect=core.default_executor)
+        runner = trailrunner.TrailRunner(factory)
+
+        with self.subTest("decorated"):
+            self.assertTrue(core._is_inline(get_posix))
+            result = runner.run(paths, get_posix)
+            self.assertDictEqual({p: p.as_posix() for p in paths}, result)
+            factory.assert_not_called()
+
+        with self.subTest("partial"):
+            func = partial(trailrunner.inline(get_name), suffix="!")
+            self.assertTrue(core._is_inline(func))
+            result = runner.run(paths, func)
+            self.assertDictEqual({p: f"{p.name}!" for p in paths}, result)
+            factory.assert_not_called()
+
+        with self.subTest("not inline"):
+            self.assertFalse(core._is_inline(partial(str)))
+
+    def test_run_serial(self) -> None:
+        def get_posix(path: Path) -> str:
+            return path.as_posix()
+
+        paths = [Path("foo.py"), Path("bar.py"), Path("baz.py")]
+        expected = {p: p.as_posix() for p in paths}
+
+        with self.subTest("default threshold"):
+            factory = Mock(side_effect=core.thread_executor)
+            runner = trailrunner.TrailRunner(factory)
+            self.assertDictEqual({}, runner.run([], get_posix))
+            self.assertDictEqual(
+                {paths[0]: "foo.py"}, runner.run(paths[:1], get_posix)
+            )
+            factory.assert_not_called()
+
+            self.assertDictEqual(expected, runner.run(paths, get_posix))
+            factory.assert_called_once_with()
+
+        with self.subTest("custom threshold"):
+            factory = Mock(side_effect=core.thread_executor)
+            runner = trailrunner.TrailRunner(factory, serial_threshold=3)
+            self.assertDictEqual(expected, runner.run(paths, get_posix))
+            factory.assert_not_called()
+
+        with self.subTest("spawn on macos"):
+            with patch("sys.platform", "darwin"):
+                self.assertEqual(
+                    core.SPAWN_SERIAL_THRESHOLD, core.default_serial_threshold()
+                )
+            with patch("sys.platform", "linux"):
+                self.assertEqual(core.SERIAL_THRESHOLD, core.default_serial_threshold())
+
+    def test_reuse_executor(self) -> None:
+        def get_posix(path: Path) -> str:
+            return path.as_posix()
+
+        paths = [Path("foo.py"), Path("bar.py")]
+        expected = {p: p.as_posix() for p in paths}
+
+        with self.subTest("default"):
+            factory = Mock(side_effect=core.thread_executor)
+            runner = trailrunner.TrailRunner(factory)
+            self.assertDictEqual(expected, runner.run(paths, get_posix))
+            self.assertDictEqual(expected, runner.run(paths, get_posix))
+            self.assertEqual(2, factory.call_count)
+
+        with self.subTest("close unused"):
+            factory = Mock(side_effect=core.thread_executor)
+            runner = trailrunner.TrailRunner(factory)
+            runner.close()
+            factory.assert_not_called()
+
+        with self.subTest("context manager"):
+            factory = Mock(side_effect=core.thread_executor)
+            with trailrunner.TrailRunner(factory) as runner:
+                self.assertDictEqual(expected, runner.run(paths, get_posix))
+                self.assertDictEqual(expected, runner.run(paths, get_posix))
+                executor = runner._executor
+                self.assertIsNotNone(executor)
+            factory.assert_called_once_with()
+            self.assertIsNone(runner._executor)
+            with self.assertRaises(RuntimeError):
+                executor.submit(get_posix, paths[0])  # type: ignore
+
     def test_walk_then_run(self) -> None:
         (self.td / "pyproject.toml").write_text("\n")
         (self.td / "foo").mkdir()
@@ -321,6 +725,87 @@ class CoreTest(TestCase):
                 ]
                 self.assertListEqual(expected, result)
 
+        with self.subTest("parallel walk"):
+            with cd(self.td):
+                result = sorted(
+                    self.trailrunner.walk_and_run(
+                        [Path(".")], say_hello, concurrency=2
+                    ).keys()
+                )
+                self.assertEqual(6, len(result))
+
+        with self.subTest("chunked"):
+            executor = core.thread_executor()
+            runner = trailrunner.TrailRunner(lambda: executor)
+            with patch.object(executor, "submit", wraps=executor.submit) as submit:
+                with cd(self.td):
+                    results = runner.walk_and_run([Path(".")], say_hello, chunksize=4)
+                self.assertEqual(6, len(results))
+                sizes = [len(args[0][2]) for args in submit.call_args_list]
+                self.assertEqual(6, sum(sizes))
+                self.assertLessEqual(max(sizes), 4)
+
+        with self.subTest("single path chunks"):
+            with cd(self.td):
+                results = self.trailrunner.walk_and_run(
+                    [Path(".")], say_hello, chunksize=1
+                )
+            self.assertEqual(6, len(results))
+
+        with self.subTest("walk order"):
+            walked = [self.td / "foo" / name for name in ("foo.py", "bar.py", "car.py")]
+            with patch.object(self.trailrunner, "walk", lambda path: iter(walked)):
+                with patch.object(core, "as_completed", lambda fs: list(fs)[::-1]):
+                    results = self.trailrunner.walk_and_run(
+                        [self.td], say_hello, chunksize=1
+                    )
+            self.assertListEqual(walked, list(results))
+
+        with self.subTest("walk error"):
+            with patch.object(self.trailrunner, "walk", side_effect=OSError("boom")):
+                with self.assertRaisesRegex(OSError, "boom"):
+                    self.trailrunner.walk_and_run([self.td], say_hello)
+
+        with self.subTest("walk error after paths"):
+
+            def walk(path: Path) -> Iterator[Path]:
+                yield from (self.td / "foo").iterdir()
+                raise OSError("boom")
+
+            with patch.object(self.trailrunner, "walk", walk):
+                with self.assertRaisesRegex(OSError, "boom"):
+                    self.trailrunner.walk_and_run([self.td], say_hello)
+
+        with self.subTest("serial"):
+            factory = Mock(side_effect=core.thread_executor)
+            runner = trailrunner.TrailRunner(factory, serial_threshold=10)
+            with cd(self.td):
+                results = runner.walk_and_run([Path("foo")], say_hello)
+            self.assertEqual(4, len(results))
+            factory.assert_not_called()
+
+        with self.subTest("serial walk error"):
+
+            def walk_one(path: Path) -> Iterator[Path]:
+                yield self.td / "foo" / "foo.py"
+                raise OSError("boom")
+
+            with patch.object(self.trailrunner, "walk", walk_one):
+                with self.assertRaisesRegex(OSError, "boom"):
+                    self.trailrunner.walk_and_run([self.td], say_hello)
+
+        with self.subTest("bail out while walking"):
+
+            def walk_many(path: Path) -> Iterator[Path]:
+                for idx in range(10):
+                    yield self.td / f"{idx}.py"
+
+            runner = trailrunner.TrailRunner(Mock(side_effect=RuntimeError("nope")))
+            with patch.object(runner, "walk", walk_many):
+                with patch.object(core, "WALK_QUEUE_SIZE", 1):
+                    with self.assertRaisesRegex(RuntimeError, "nope"):
+                        runner.walk_and_run([self.td], say_hello)
+
         (self.td / ".gitignore").write_text("**/foo.py\nvendor/\n")
 
         with self.subTest("local root with gitignore"):